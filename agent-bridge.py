@@ -8,10 +8,22 @@ Enables autonomous 3-agent communication:
 - Grok web chat agent
 
 Agents send/receive messages via MCP tools without direct API calls.
-Messages stored in .agent-comm/messages.jsonl for persistence.
+Messages stored in .agent-comm/messages.NNNN.jsonl for persistence.
+The log is append-only and split into size-capped segments: reads append
+{"ack": id} tombstones instead of rewriting anything, and the oldest
+segments are dropped once most of their messages are acked.
 """
 
+import atexit
+import io
 import json
+import logging
+import os
+import platform
+import queue
+import threading
+import time
+from collections import deque
 from pathlib import Path
 from datetime import datetime
 try:
@@ -19,15 +31,584 @@ try:
 except ImportError:
     print("ERROR: Install MCP SDK: pip install 'mcp[cli]'")
     exit(1)
+try:
+    import orjson  # optional: C JSON codec, much faster on the poll loop
+except ImportError:
+    orjson = None
+try:
+    import liburing  # optional (Linux): batch concurrent appends via io_uring
+except ImportError:
+    liburing = None
+try:
+    from inotify_simple import INotify, flags  # optional (Linux): wake tailer
+except ImportError:
+    INotify = None
 
 mcp = FastMCP("agent-bridge-3way")
 
 COMM_DIR = Path(".agent-comm")
-COMM_FILE = COMM_DIR / "messages.jsonl"
+LEGACY_FILE = COMM_DIR / "messages.jsonl"  # pre-segment single-file log
 
 COMM_DIR.mkdir(exist_ok=True)
-if not COMM_FILE.exists():
-    COMM_FILE.touch()
+
+AGENTS = frozenset({"trae", "kilo", "grok"})
+
+# Roll over to a new segment once the current one reaches this size
+SEGMENT_MAX = 8 << 20
+
+# Drop the oldest segment once more than this fraction of its messages are
+# acked, carrying the unacked rest forward to the newest segment
+COMPACT_RATIO = 0.5
+
+# Read the log in large binary chunks rather than line by line
+READ_CHUNK = io.DEFAULT_BUFFER_SIZE * 16
+
+# Records go out as one os.write() on an O_APPEND descriptor: the kernel
+# places each write atomically at the end of the file, even with several
+# agent processes appending at once
+FSYNC = os.environ.get("AGENT_BRIDGE_FSYNC") == "1"  # fsync every append
+
+_fd_lock = threading.Lock()
+
+# Without inotify the tailer polls the log this often (seconds)
+TAIL_POLL = 0.05
+
+# Message ids are strings (integers in logs written by older versions)
+_ID_TYPES = (str, int)
+
+log = logging.getLogger("agent-bridge")
+
+# Per-process view of the log, up to (segment, byte) `scanned`: acked ids
+# (with the last segment each was seen in, so they are forgotten once it is
+# dropped), which segment holds each unacked message, and per-segment
+# [messages, acked] counts
+_state = {
+    "scanned": (0, 0),
+    "acked": {},
+    "live": {},
+    "counts": {},
+    "last_id": 0,
+}
+
+# Unread messages per (agent, session), filled by the tailer thread, with
+# the inbox key of every queued id and how many queued messages have since
+# been acked by another process. _inbox_lock guards these and the scan
+# fields of _state.
+_inbox = {}
+_queued = {}
+_inbox_acked = {}
+_inbox_lock = threading.Lock()
+_tailer = {"thread": None, "ready": threading.Event(), "error": None}
+
+
+def _dumps(obj) -> bytes:
+    """Encode one log record (orjson if installed, stdlib json otherwise)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            pass  # e.g. lone surrogates, which stdlib json escapes
+    return json.dumps(obj).encode("utf-8")
+
+
+def _loads(raw: bytes):
+    """
+    Decode one log record. Falls back to stdlib json for what orjson
+    rejects (escaped lone surrogates), so it reads whatever _dumps wrote.
+    Both raise ValueError subclasses on bad JSON or bad UTF-8, so callers
+    catch ValueError.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw)
+
+
+def _segment_path(seg: int) -> Path:
+    return COMM_DIR / f"messages.{seg:04d}.jsonl"
+
+
+def _segments() -> list:
+    """Ids of the segments on disk, oldest first."""
+    ids = []
+    for path in COMM_DIR.glob("messages.*.jsonl"):
+        try:
+            ids.append(int(path.name.split(".")[1]))
+        except ValueError:
+            continue
+    return sorted(ids)
+
+
+def _open_head() -> int:
+    """Open the newest segment for appending, starting a new one if full."""
+    seg = max(_segments(), default=0)
+    path = _segment_path(seg)
+    if path.exists() and path.stat().st_size >= SEGMENT_MAX:
+        path = _segment_path(seg + 1)
+    return os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+
+def _log_fd() -> int:
+    """Current append descriptor (caller holds _fd_lock)."""
+    global _FD
+    st = os.fstat(_FD)
+    # Segment full, or dropped by another process: move to the newest one
+    if st.st_size >= SEGMENT_MAX or st.st_nlink == 0:
+        os.close(_FD)
+        _FD = _open_head()
+    return _FD
+
+
+def _migrate_legacy() -> None:
+    """
+    Move a single-file messages.jsonl log into the segment layout.
+
+    The old file is claimed by renaming it to messages.migrating, so a
+    migration that was interrupted is picked up again by the next process
+    to start. Ids given to id-less records are derived from their byte
+    offsets, so records copied twice carry the same id and are deduplicated
+    like carried-forward messages.
+    """
+    claimed = LEGACY_FILE.with_suffix(".migrating")
+    try:
+        os.rename(LEGACY_FILE, claimed)  # only one process wins the rename
+    except FileNotFoundError:
+        pass
+
+    records = []
+    try:
+        with open(claimed, "rb") as f:
+            for offset, line in _iter_lines(f, final=True):
+                try:
+                    rec = _loads(line)
+                except ValueError:  # bad JSON or bad UTF-8
+                    continue
+                if not isinstance(rec, dict):
+                    continue
+                if "ack" not in rec and "id" not in rec:
+                    rec["id"] = f"legacy-{offset:x}"
+                records.append(_dumps(rec) + b"\n")
+    except FileNotFoundError:  # nothing to migrate, or another process did
+        return
+
+    fd = _open_head()
+    try:
+        os.write(fd, b"".join(records))
+    finally:
+        os.close(fd)
+    claimed.unlink(missing_ok=True)
+    # Byte offsets into the old file are meaningless now
+    for path in COMM_DIR.glob("offset.*"):
+        path.unlink(missing_ok=True)
+
+
+class _UringAppender:
+    """
+    Background writer that coalesces concurrent appends into io_uring batches.
+
+    Callers enqueue a payload and wait for its completion. The writer thread
+    drains up to `depth` queued payloads, queues one write SQE per payload
+    (linked so they land in order), submits them with a single
+    io_uring_enter and reaps the completions.
+    """
+
+    def __init__(self, depth: int = 64):
+        self.depth = depth
+        self.cqe = liburing.Cqe()
+        self.ring = self._new_ring()
+        self.pending = queue.Queue()
+        threading.Thread(
+            target=self._run, name="agent-bridge-uring", daemon=True
+        ).start()
+
+    def _new_ring(self):
+        ring = liburing.Ring()
+        liburing.io_uring_queue_init(self.depth, ring)
+        return ring
+
+    def write(self, payload: bytes) -> None:
+        item = {
+            "payload": payload,
+            "done": threading.Event(),
+            "written": False,
+            "error": None,
+        }
+        self.pending.put(item)
+        item["done"].wait()
+        if item["error"] is not None:
+            raise item["error"]
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < self.depth:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if self.ring is None:
+                    for item in batch:
+                        _write_direct(item["payload"])
+                        item["written"] = True
+                else:
+                    self._submit(batch)
+            except BaseException as e:
+                # Fail only what wasn't written; the writer keeps serving
+                for item in batch:
+                    if not item["written"] and item["error"] is None:
+                        item["error"] = e
+                if self.ring is not None:
+                    self._reset()
+            finally:
+                for item in batch:
+                    item["done"].set()
+
+    def _reset(self) -> None:
+        """Replace a ring left with unreaped completions by a failed batch."""
+        ring, self.ring = self.ring, None
+        try:
+            liburing.io_uring_queue_exit(ring)
+            self.ring = self._new_ring()
+        except BaseException:
+            pass  # no usable ring: later batches go through os.write
+
+    def _submit(self, batch: list) -> None:
+        with _fd_lock:
+            fd = _log_fd()
+            for i, item in enumerate(batch):
+                payload = item["payload"]
+                sqe = liburing.io_uring_get_sqe(self.ring)
+                # offset -1: use the file position, i.e. append under O_APPEND
+                liburing.io_uring_prep_write(sqe, fd, payload, len(payload), -1)
+                liburing.io_uring_sqe_set_data64(sqe, i)
+                if i + 1 < len(batch):
+                    liburing.io_uring_sqe_set_flags(sqe, liburing.IOSQE_IO_LINK)
+            liburing.io_uring_submit(self.ring)
+
+            for _ in batch:
+                liburing.io_uring_wait_cqe(self.ring, self.cqe)
+                cqe = self.cqe[0]
+                item, res = batch[cqe.user_data], cqe.res
+                liburing.io_uring_cqe_seen(self.ring, cqe)
+                if res < 0:
+                    item["error"] = OSError(-res, os.strerror(-res))
+                elif res != len(item["payload"]):
+                    item["error"] = OSError("short write to message log")
+                else:
+                    item["written"] = True
+
+            if FSYNC:
+                os.fsync(fd)
+
+
+# io_uring only pays off when many appends are in flight at once; a lone
+# send is several times slower than a plain write. Set
+# AGENT_BRIDGE_IO_URING=1 to batch concurrent appends through it.
+_uring = None
+if (
+    liburing is not None
+    and platform.system() == "Linux"
+    and os.environ.get("AGENT_BRIDGE_IO_URING") == "1"
+):
+    try:
+        _uring = _UringAppender()
+    except OSError:  # io_uring disabled by the kernel or seccomp
+        _uring = None
+
+
+def _write_direct(payload: bytes) -> None:
+    with _fd_lock:
+        fd = _log_fd()
+        os.write(fd, payload)
+        if FSYNC:
+            os.fsync(fd)
+
+
+def _append(payload: bytes) -> None:
+    """Append encoded records to the log (one write per payload)."""
+    if _uring is not None:
+        _uring.write(payload)
+    else:
+        _write_direct(payload)
+
+
+def _close_log() -> None:
+    os.close(_FD)
+
+
+_ts_cache = (0, "")  # (epoch ms, its ISO 8601 string), swapped atomically
+
+
+def _timestamp() -> str:
+    """Local ISO 8601 timestamp, formatted at most once per millisecond."""
+    global _ts_cache
+    ms = time.time_ns() // 1_000_000
+    if ms != _ts_cache[0]:
+        # Integer split: ms / 1000 as a float can round down a millisecond
+        now = datetime.fromtimestamp(ms // 1000).replace(
+            microsecond=ms % 1000 * 1000
+        )
+        _ts_cache = (ms, now.isoformat(timespec="milliseconds"))
+    return _ts_cache[1]
+
+
+# Agent servers are separate processes whose clocks may tick coarsely, so
+# ids carry a per-process tag as well as the timestamp
+_ID_TAG = f"{os.getpid():x}{os.urandom(4).hex()}"
+
+
+def _next_id() -> str:
+    """Unique message id: this process's increasing ns clock plus its tag."""
+    _state["last_id"] = max(time.time_ns(), _state["last_id"] + 1)
+    return f"{_state['last_id']:x}-{_ID_TAG}"
+
+
+def _iter_lines(f, start: int = 0, final: bool = False):
+    """
+    Yield (offset, line) for each complete line of `f` from byte `start`.
+
+    Scans large chunks with bytes.find instead of iterating lines, and only
+    joins buffered chunks once a newline is present. A trailing partial line
+    (a write still in progress) is not yielded unless `final` is set, for
+    files that are no longer being written.
+    """
+    f.seek(start)
+    chunks = []
+    base = start  # file offset of the first buffered byte
+    while True:
+        chunk = f.read(READ_CHUNK)
+        if not chunk:
+            tail = b"".join(chunks)
+            if final and tail:
+                yield base, tail
+            return
+        chunks.append(chunk)
+        if chunk.find(b"\n") == -1:
+            continue
+        buf = b"".join(chunks)
+        pos = 0
+        end = buf.find(b"\n")
+        while end != -1:
+            yield base + pos, buf[pos:end + 1]
+            pos = end + 1
+            end = buf.find(b"\n", pos)
+        chunks = [buf[pos:]]
+        base += pos
+
+
+def _note_message(seg: int, msg_id) -> bool:
+    """Count a message record; True if it is unacked and not seen before."""
+    counts = _state["counts"].setdefault(seg, [0, 0])
+    counts[0] += 1
+    acked = _state["acked"]
+    if msg_id in acked:
+        counts[1] += 1
+        acked[msg_id] = max(acked[msg_id], seg)  # a carried-forward copy
+        return False
+    moved_from = _state["live"].get(msg_id)
+    _state["live"][msg_id] = seg
+    if moved_from is None:
+        return True
+    # Carried forward from an older segment: already queued once
+    if moved_from in _state["counts"]:
+        _state["counts"][moved_from][0] -= 1
+    return False
+
+
+def _note_ack(msg_id, seg: int) -> None:
+    acked = _state["acked"]
+    acked[msg_id] = max(seg, acked.get(msg_id, seg))
+    msg_seg = _state["live"].pop(msg_id, None)
+    if msg_seg in _state["counts"]:
+        _state["counts"][msg_seg][1] += 1
+
+    # Acked by another process while still queued here: once acked
+    # messages make up most of that inbox, rebuild it without them
+    key = _queued.pop(msg_id, None)
+    if key is not None:
+        _inbox_acked[key] = _inbox_acked.get(key, 0) + 1
+        inbox = _inbox[key]
+        if _inbox_acked[key] * 2 > len(inbox):
+            _inbox[key] = deque(m for m in inbox if m["id"] in _queued)
+            _inbox_acked[key] = 0
+
+
+def _forget(seg: int) -> None:
+    """Drop per-id state that only refers to a dropped segment."""
+    _state["counts"].pop(seg, None)
+    for ids in (_state["acked"], _state["live"]):
+        for msg_id in [i for i, s in ids.items() if s <= seg]:
+            del ids[msg_id]
+
+
+def _reclaim() -> None:
+    """
+    Drop the longest prefix of fully scanned old segments in which most
+    messages are acked. The ratio is taken over the prefix as a whole, so a
+    few unread messages in the oldest segment don't pin the acked segments
+    behind it. Unacked messages are re-appended to the newest segment
+    first. Only a prefix of the log is dropped, so every ack that is lost
+    refers to a message that is gone too.
+    """
+    segs = [seg for seg in _segments()[:-1] if seg < _state["scanned"][0]]
+    drop = total = acked = 0
+    for i, seg in enumerate(segs):
+        seg_total, seg_acked = _state["counts"].get(seg, (0, 0))
+        total += seg_total
+        acked += seg_acked
+        if not total or acked / total > COMPACT_RATIO:
+            drop = i + 1
+
+    for seg in segs[:drop]:
+        survivors = []
+        try:
+            with open(_segment_path(seg), "rb") as f:
+                for _, line in _iter_lines(f):
+                    try:
+                        rec = _loads(line)
+                    except ValueError:  # bad JSON or bad UTF-8
+                        continue
+                    if (
+                        isinstance(rec, dict)
+                        and "ack" not in rec
+                        and isinstance(rec.get("id"), _ID_TYPES)
+                        and rec["id"] not in _state["acked"]
+                    ):
+                        survivors.append(line)
+        except FileNotFoundError:  # another process got here first
+            _forget(seg)
+            continue
+
+        if survivors:
+            _append(b"".join(survivors))
+        _segment_path(seg).unlink(missing_ok=True)
+        _forget(seg)
+
+
+def _tail_once() -> bool:
+    """Read log records past `scanned` into _state and the inboxes."""
+    with _inbox_lock:
+        start = _state["scanned"]
+        end = start
+        try:
+            for seg in _segments():
+                if seg < start[0]:
+                    continue
+                offset = start[1] if seg == start[0] else 0
+                end = (seg, offset)
+                try:
+                    f = open(_segment_path(seg), "rb")
+                except FileNotFoundError:  # dropped by another process
+                    continue
+                with f:
+                    for line_start, raw in _iter_lines(f, offset):
+                        end = (seg, line_start + len(raw))
+                        _tail_record(seg, raw)
+        finally:
+            # Past whatever was read, so a record that raised isn't retried
+            _state["scanned"] = end
+        return end != start
+
+
+def _tail_record(seg: int, raw: bytes) -> None:
+    """Apply one log record; malformed ones are skipped."""
+    try:
+        msg = _loads(raw)
+    except ValueError:  # bad JSON or bad UTF-8
+        return
+    if not isinstance(msg, dict):
+        return
+    if "ack" in msg:
+        if isinstance(msg["ack"], _ID_TYPES):
+            _note_ack(msg["ack"], seg)
+        return
+    msg_id, key = msg.get("id"), (msg.get("to"), msg.get("session"))
+    if not (
+        isinstance(msg_id, _ID_TYPES)
+        and isinstance(key[0], str)
+        and isinstance(key[1], str)
+    ):
+        return
+    # A copy carried forward after its state was forgotten may still be
+    # queued from its first sighting
+    if _note_message(seg, msg_id) and msg_id not in _queued:
+        _inbox.setdefault(key, deque()).append(msg)
+        _queued[msg_id] = key
+
+
+def _catch_up() -> None:
+    """Read new log records, then drop old segments if any were read."""
+    if _tail_once():
+        with _inbox_lock:
+            _reclaim()
+
+
+def _log_grew() -> bool:
+    """True if the log extends past `scanned` (a stat or two, no reads)."""
+    seg, offset = _state["scanned"]
+    try:
+        if os.stat(_segment_path(seg)).st_size > offset:
+            return True
+    except FileNotFoundError:
+        return True
+    return _segment_path(seg + 1).exists()
+
+
+def _tail() -> None:
+    """Tailer thread: follow the log, waking on inotify events or a poll."""
+    try:
+        watcher = None
+        if INotify is not None:
+            try:
+                watcher = INotify()
+                watcher.add_watch(
+                    COMM_DIR, flags.MODIFY | flags.CREATE | flags.MOVED_TO
+                )
+            except OSError:  # inotify instance limit reached
+                watcher = None
+
+        while True:
+            try:
+                _catch_up()
+            except OSError:
+                pass  # e.g. a segment vanished mid-read; retried on next wake
+            except Exception:
+                log.exception("agent-bridge: message log scan failed")
+            _tailer["ready"].set()
+
+            if watcher is not None:
+                watcher.read(timeout=1000)
+            else:
+                time.sleep(TAIL_POLL)
+    except BaseException as e:
+        # Wake waiters; _start_tailer reports the dead thread
+        _tailer["error"] = e
+        _tailer["ready"].set()
+        raise
+
+
+def _start_tailer() -> None:
+    """Start the tailer on first use and wait for its initial scan."""
+    if _tailer["thread"] is None:
+        with _inbox_lock:
+            if _tailer["thread"] is None:
+                _tailer["thread"] = threading.Thread(
+                    target=_tail, name="agent-bridge-tail", daemon=True
+                )
+                _tailer["thread"].start()
+    _tailer["ready"].wait()
+    if _tailer["error"] is not None:
+        raise RuntimeError(
+            "agent-bridge: message log tailer has stopped"
+        ) from _tailer["error"]
+
+
+_migrate_legacy()
+_FD = _open_head()
+atexit.register(_close_log)
 
 
 @mcp.tool()
@@ -43,19 +624,19 @@ def send_message(to: str, content: str, session: str = "default") -> str:
     Returns:
         Confirmation with timestamp and recipient
     """
-    if to not in ("trae", "kilo", "grok"):
+    if to not in AGENTS:
         return "ERROR: to must be 'trae', 'kilo', or 'grok'"
 
     msg = {
-        "timestamp": datetime.now().isoformat(),
+        "id": _next_id(),
+        "timestamp": _timestamp(),
         "from": "other",  # receiver infers sender from context
         "to": to,
         "session": session,
         "content": content,
     }
 
-    with open(COMM_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(msg) + "\n")
+    _append(_dumps(msg) + b"\n")
 
     return f"✅ Message sent to {to} (session: {session})"
 
@@ -65,8 +646,9 @@ def get_new_messages(
     for_agent: str, session: str = "default", limit: int = 15
 ) -> list:
     """
-    Retrieve new messages sent to this agent.
-    Automatically marks messages as read (removes from file).
+    Retrieve new messages sent to this agent, oldest first.
+    Automatically marks messages as read (appends an ack to the log).
+    Messages beyond `limit` stay queued for the next call.
     
     Args:
         for_agent: Your agent name ("trae", "kilo", or "grok")
@@ -76,44 +658,56 @@ def get_new_messages(
     Returns:
         List of new messages with timestamps
     """
-    if for_agent not in ("trae", "kilo", "grok"):
+    if for_agent not in AGENTS:
         return []
 
-    messages = []
-    new_lines = []
+    _start_tailer()
 
-    if not COMM_FILE.exists():
-        return []
+    # The tailer may not have woken yet for a message appended just before
+    # this call: read it now rather than report an empty inbox
+    if len(_inbox.get((for_agent, session), ())) < limit and _log_grew():
+        try:
+            _catch_up()
+        except OSError:
+            pass  # the tailer retries on its next wake
 
-    with open(COMM_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            try:
-                msg = json.loads(line)
-                if msg.get("to") == for_agent and msg.get("session") == session:
-                    messages.append(
-                        {
-                            "from": "the-other-agent",
-                            "content": msg["content"],
-                            "timestamp": msg["timestamp"],
-                        }
-                    )
-                else:
-                    new_lines.append(line)
-            except json.JSONDecodeError:
-                new_lines.append(line)
+    messages = []
+    with _inbox_lock:
+        key = (for_agent, session)
+        inbox = _inbox.get(key, ())
+        while inbox and len(messages) < limit:
+            msg = inbox.popleft()
+            if _queued.pop(msg["id"], None) is None:
+                # Another process serving this agent acked it already
+                _inbox_acked[key] -= 1
+            else:
+                messages.append(msg)
+
+        # Mark as read: one append of ack records. They land at or past
+        # `scanned`, where the tailer will see them again.
+        if messages:
+            _append(b"".join(
+                _dumps({"ack": m["id"], "for": for_agent}) + b"\n"
+                for m in messages
+            ))
+            for m in messages:
+                _note_ack(m["id"], _state["scanned"][0])
 
-    # Rewrite file without read messages (mark as read)
-    with open(COMM_FILE, "w", encoding="utf-8") as f:
-        f.writelines(new_lines)
+    messages = [
+        {
+            "from": "the-other-agent",
+            "content": m.get("content"),
+            "timestamp": m.get("timestamp"),
+        }
+        for m in messages
+    ]
 
-    return messages[-limit:] if messages else []
+    return messages
 
 
 if __name__ == "__main__":
     # Run as local stdio MCP server (compatible with Trae, Kilo, Grok)
     print("Starting Agent Bridge MCP Server...")
     print("✅ Ready for 3-agent communication")
-    print("📁 Messages stored in: .agent-comm/messages.jsonl")
+    print("📁 Messages stored in: .agent-comm/messages.NNNN.jsonl")
     mcp.run(transport="stdio")
@@ -1,10 +1,15 @@
 # Quick sketch—agent query → memory layers
+from concurrent.futures import ThreadPoolExecutor
+
 from lucid_memory import Lucid  # import your forks
 from lightrag import LightRAG
 from pageindex import PageTree
 
+# One worker per layer; each lookup is independent I/O keyed on the query
+_layers = ThreadPoolExecutor(max_workers=3)
+
 def query_agent(q):
-    recent = Lucid.recall(q)  # fast, personal
-    graph = LightRAG.search(recent)  # connections
-    page = PageTree.get_chunk(graph)  # exact text
-    return f"Context: {recent} + {graph} + {page}"
+    recent = _layers.submit(Lucid.recall, q)  # fast, personal
+    graph = _layers.submit(LightRAG.search, q)  # connections
+    page = _layers.submit(PageTree.get_chunk, q)  # exact text
+    return f"Context: {recent.result()} + {graph.result()} + {page.result()}"
@@ -4,77 +4,268 @@ Start here to build your document tree: PDFs, markdown, code files.
 No vector quantization, no hallucinations—just exact text retrieval.
 """
 
+from bisect import bisect_right
 from pathlib import Path
 import json
+import mmap
+
+try:
+    import orjson  # optional: faster tree export
+except ImportError:
+    orjson = None
 
 # Example: If PageIndex were installed locally
 # from pageindex import PageTree
 
 class SimplePageIndex:
-    """Minimal PageIndex implementation to show the idea."""
+    """Minimal PageIndex implementation to show the idea.
+    
+    Documents are appended to one data file that is searched through mmap.
+    index.jsonl is an append-only log: its first record names the data file
+    and each later record says where one document and its lines and sections
+    live (the newest record per filename wins). Space left behind by
+    re-added documents is compacted away once it outweighs the live data.
+    """
     
     def __init__(self, docs_path="./docs"):
         self.docs_path = Path(docs_path)
-        self.tree = {}
         self.docs_path.mkdir(exist_ok=True)
+        self.meta_file = self.docs_path / "index.jsonl"
+        
+        # filename -> {'start', 'end': byte offsets in the data file,
+        #              'lines': [line start offsets relative to 'start'],
+        #              'sections': {name: [first line idx, end line idx]}}
+        self.docs = {}
+        self.data_file = None
+        torn = False
+        if self.meta_file.exists():
+            with open(self.meta_file, 'rb') as f:
+                for raw in f:
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        torn = True  # final record of an interrupted add
+                        continue
+                    if 'data' in record:
+                        self.data_file = self.docs_path / record['data']
+                    else:
+                        self.docs[record.pop('doc')] = record
+        if self.data_file is None or torn:
+            self._write_meta(self.data_file or self.docs_path / "index.0.dat")
+        self.data_file.touch()
+        self._size = self.data_file.stat().st_size
+        self._section_cache = {}  # (filename, section) -> get_section result
+        self._fold_cache = {}  # filename -> (lowercased text, line starts)
+        self._mm = None
+        self._stale = True  # data file grew since it was last mapped
+    
+    def _write_meta(self, data_file):
+        """Atomically replace index.jsonl with a full snapshot of self.docs."""
+        tmp = self.meta_file.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            f.write(json.dumps({'data': data_file.name}) + '\n')
+            for filename, doc in self.docs.items():
+                f.write(json.dumps({'doc': filename, **doc}) + '\n')
+        tmp.replace(self.meta_file)
+        self.data_file = data_file
+    
+    @property
+    def mm(self):
+        """The mapped data file, remapped on first read after it grew."""
+        if self._stale:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            if self._size:  # mmap can't map an empty file
+                with open(self.data_file, 'rb') as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._stale = False
+        return self._mm
+    
+    def _line_end(self, doc, i):
+        """Byte offset just past line i's text (its newline excluded)."""
+        lines = doc['lines']
+        if i + 1 < len(lines):
+            return doc['start'] + lines[i + 1] - 1
+        return doc['end']
+    
+    def _text(self, doc):
+        return self.mm[doc['start']:doc['end']].decode('utf-8')
+    
+    def _line(self, doc, i):
+        start = doc['start'] + doc['lines'][i]
+        return self.mm[start:self._line_end(doc, i)].decode('utf-8')
+    
+    def _section_text(self, doc, first, end):
+        """Lines first..end-1 as one string, newlines included."""
+        if first == end:
+            return ''
+        start = doc['start'] + doc['lines'][first]
+        return self.mm[start:self._line_end(doc, end - 1)].decode('utf-8')
     
     def add_document(self, filename, content):
         """Add a document and build its tree structure."""
-        # Save document
-        filepath = self.docs_path / filename
-        filepath.write_text(content)
+        data = content.encode('utf-8')
         
-        # Build tree: split into sections
+        # Save document at the end of the data file
+        with open(self.data_file, 'ab') as f:
+            start = f.tell()
+            f.write(data)
+        self._size = start + len(data)
+        self._stale = True
+        
+        lines = [0]
+        nl = data.find(b'\n')
+        while nl != -1:
+            lines.append(nl + 1)
+            nl = data.find(b'\n', nl + 1)
+        
+        # Build tree: split into sections (each a contiguous run of lines)
         sections = {}
         current_section = None
         
-        for line_num, line in enumerate(content.split('\n'), 1):
+        for i, line in enumerate(content.split('\n')):
             if line.startswith('#'):
                 current_section = line.strip('# ')
-                sections[current_section] = []
+                sections[current_section] = [i + 1, i + 1]
             elif current_section:
-                sections[current_section].append({
-                    'line': line_num,
-                    'text': line
-                })
+                sections[current_section][1] = i + 1
+        
+        doc = self.docs[filename] = {
+            'start': start,
+            'end': start + len(data),
+            'lines': lines,
+            'sections': sections,
+        }
+        with open(self.meta_file, 'a') as f:
+            f.write(json.dumps({'doc': filename, **doc}) + '\n')
+        self._section_cache = {
+            key: value for key, value in self._section_cache.items()
+            if key[0] != filename
+        }
+        self._fold_cache.pop(filename, None)
         
-        self.tree[filename] = sections
+        live = sum(d['end'] - d['start'] for d in self.docs.values())
+        if self._size - live > live:
+            self._compact()
         print(f"Indexed: {filename}")
     
+    def _compact(self):
+        """Copy live documents into a fresh data file, dropping stale ranges.
+        
+        The new file gets a new name and index.jsonl is swapped atomically,
+        so a crash leaves either the old or the new index intact.
+        """
+        old = self.data_file
+        number = int(old.stem.rpartition('.')[2]) + 1
+        new = self.docs_path / f"index.{number}.dat"
+        mm = self.mm
+        with open(new, 'wb') as f:
+            for doc in self.docs.values():
+                start = f.tell()
+                f.write(mm[doc['start']:doc['end']])
+                doc['end'] += start - doc['start']
+                doc['start'] = start
+            self._size = f.tell()
+        self._write_meta(new)
+        self._mm.close()
+        self._mm = None
+        self._stale = True
+        old.unlink()
+    
+    @property
+    def tree(self):
+        """Document tree: {filename: {section: [{'line', 'text'}]}}."""
+        return {
+            filename: {
+                name: self._section_lines(doc, first, end)
+                for name, (first, end) in doc['sections'].items()
+            }
+            for filename, doc in self.docs.items()
+        }
+    
+    def _section_lines(self, doc, first, end):
+        return [{'line': i + 1, 'text': self._line(doc, i)}
+                for i in range(first, end)]
+    
     def get_section(self, filename, section_name):
-        """Retrieve exact text from a section."""
-        if filename not in self.tree:
+        """Retrieve exact text from a section (built once, then cached)."""
+        if filename not in self.docs:
             return None
         
-        if section_name not in self.tree[filename]:
+        doc = self.docs[filename]
+        if section_name not in doc['sections']:
             return None
         
-        lines = self.tree[filename][section_name]
-        return {
-            'section': section_name,
-            'lines': lines,
-            'text': '\n'.join([l['text'] for l in lines])
-        }
+        cached = self._section_cache.get((filename, section_name))
+        if cached is None:
+            first, end = doc['sections'][section_name]
+            cached = self._section_cache[(filename, section_name)] = {
+                'section': section_name,
+                'lines': self._section_lines(doc, first, end),
+                'text': self._section_text(doc, first, end)
+            }
+        # Callers get their own copies; the cache must not change under them
+        return {**cached, 'lines': [dict(line) for line in cached['lines']]}
     
     def search_keyword(self, keyword):
-        """Find all lines containing keyword across all docs."""
+        """Find all lines containing keyword across all docs.
+        
+        Each document's lowercased text and line starts are cached on
+        first search. Hits are found with str.find over each section's
+        span and mapped to lines by bisection, one hit per line. Line text
+        comes from the mapped file, decoded per section that has a hit.
+        """
+        needle = keyword.lower()
         results = []
-        for doc, sections in self.tree.items():
-            for section, lines in sections.items():
-                for line_info in lines:
-                    if keyword.lower() in line_info['text'].lower():
-                        results.append({
-                            'doc': doc,
-                            'section': section,
-                            'line': line_info['line'],
-                            'text': line_info['text']
-                        })
+        if '\n' in needle:
+            return results  # lines never contain one
+        for filename, doc in self.docs.items():
+            if not doc['sections']:
+                continue
+            cached = self._fold_cache.get(filename)
+            if cached is None:
+                folded = self._text(doc).lower()
+                starts = [0]
+                nl = folded.find('\n')
+                while nl != -1:
+                    starts.append(nl + 1)
+                    nl = folded.find('\n', nl + 1)
+                cached = self._fold_cache[filename] = (folded, starts)
+            folded, starts = cached
+            if needle not in folded:
+                continue
+            for section, (first, end) in doc['sections'].items():
+                if first == end:
+                    continue
+                stop = starts[end] - 1 if end < len(starts) else len(folded)
+                hit = folded.find(needle, starts[first], stop)
+                if hit == -1:
+                    continue
+                # Decode the section once for all of its hits
+                lines = self._section_text(doc, first, end).split('\n')
+                while hit != -1:
+                    i = bisect_right(starts, hit) - 1
+                    results.append({
+                        'doc': filename,
+                        'section': section,
+                        'line': i + 1,
+                        'text': lines[i - first]
+                    })
+                    if i + 1 == end:
+                        break
+                    # One hit per line: resume at the next line
+                    hit = folded.find(needle, starts[i + 1], stop)
         return results
     
     def export_tree(self, output_file="pageindex_tree.json"):
         """Save the tree structure for portability."""
-        with open(output_file, 'w') as f:
-            json.dump(self.tree, f, indent=2)
+        if orjson is not None:
+            Path(output_file).write_bytes(
+                orjson.dumps(self.tree, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_file, 'w') as f:
+                json.dump(self.tree, f, indent=2)
         print(f"Exported tree to {output_file}")
 
 
@@ -5,59 +5,138 @@ hopping edges to find context without keyword matching.
 """
 
 import json
+import re
+from collections import deque
+from pathlib import Path
 from typing import Dict, List, Set
 
+try:
+    import numpy as np  # optional: CSR adjacency for hop queries
+except ImportError:
+    np = None
+try:
+    import orjson  # optional: faster graph export
+except ImportError:
+    orjson = None
+try:
+    from numba import njit  # optional: compiles the CSR hop kernel
+except ImportError:
+    njit = None
+
+# Whitespace-separated tokens that may start with a capital: A-Z or any
+# non-ASCII character, settled by isupper() after matching. The leading \s
+# needs the text prefixed with a space.
+_ENTITY_RE = re.compile(r'\s(?=\S)([A-Z\x80-\U0010ffff]\S*)')
+
+
+def _bfs_kernel(indptr, indices, seeds, hops):
+    """Ids within `hops` edges of `seeds`, by BFS over CSR arrays."""
+    depth = np.full(indptr.size - 1, -1, np.int32)
+    queue = np.empty(indptr.size - 1, np.int32)
+    tail = 0
+    for s in seeds:
+        if depth[s] < 0:
+            depth[s] = 0
+            queue[tail] = s
+            tail += 1
+    head = 0
+    while head < tail:
+        v = queue[head]
+        head += 1
+        if depth[v] >= hops:
+            continue
+        for k in range(indptr[v], indptr[v + 1]):
+            u = indices[k]
+            if depth[u] < 0:
+                depth[u] = depth[v] + 1
+                queue[tail] = u
+                tail += 1
+    return queue[:tail]
+
+
+# Only worth running compiled; the pure-Python NumPy path is used otherwise
+_bfs = njit(cache=True)(_bfs_kernel) if njit is not None else None
+
+
 class SimpleLightRAG:
     """Minimal LightRAG: extract entities, build graph."""
     
     def __init__(self):
         self.entities = set()  # All entities seen
-        self.relationships = []  # (entity1, relation, entity2)
-        self.graph = {}  # entity -> {related_entity: [relations]}
+        self.relationships = set()  # distinct (entity1, relation, entity2)
+        self.graph = {}  # entity -> {related_entity: co-occurrence count}
+        self._csr = None  # (names, name_to_id, indptr, indices); None = stale
+        self._ent_cache = {}  # text -> extracted entities
     
     def extract_entities_simple(self, text):
         """Simple entity extraction (capitalized words)."""
-        tokens = text.split()
-        entities = [t.strip('.,;:!?') for t in tokens if t[0].isupper()]
-        return list(set(entities))
+        return list({
+            token.rstrip('.,;:!?')
+            for token in _ENTITY_RE.findall(' ' + text)
+            if token[0].isupper()
+        })
     
     def insert(self, text, metadata=None):
         """Insert text, extract entities and build graph."""
-        entities = self.extract_entities_simple(text)
+        # Re-indexing the same text skips extraction
+        entities = self._ent_cache.get(text)
+        if entities is None:
+            entities = self._ent_cache[text] = self.extract_entities_simple(text)
+        self._csr = None
         
         for entity in entities:
             self.entities.add(entity)
             if entity not in self.graph:
                 self.graph[entity] = {}
         
-        # Create relationships between nearby entities
-        for i, ent1 in enumerate(entities):
-            for ent2 in entities[i+1:i+3]:  # Look at next 2 entities
-                relation = "co_occurs"
-                self.relationships.append((ent1, relation, ent2))
-                
-                # Add bidirectional edge
-                if ent2 not in self.graph[ent1]:
-                    self.graph[ent1][ent2] = []
-                if ent1 not in self.graph[ent2]:
-                    self.graph[ent2] = {ent1: []}
-                
-                self.graph[ent1][ent2].append(relation)
+        # Create relationships between nearby entities (next 2 of each)
+        pairs = [*zip(entities, entities[1:]), *zip(entities, entities[2:])]
+        for ent1, ent2 in pairs:
+            self.relationships.add((ent1, "co_occurs", ent2))
+            
+            # Add bidirectional edge, weighted by repeat count
+            self.graph[ent1][ent2] = self.graph[ent1].get(ent2, 0) + 1
+            self.graph[ent2][ent1] = self.graph[ent2].get(ent1, 0) + 1
+    
+    def finalize(self):
+        """Freeze the graph into CSR int arrays for fast hop queries.
+        
+        The dict graph stays the mutable form used by insert(); query()
+        calls this again whenever an insert has happened since. Without
+        NumPy this does nothing and query() walks the dict graph.
+        """
+        if np is None:
+            return
+        
+        name_to_id = {}
+        for entity, neighbors in self.graph.items():
+            name_to_id.setdefault(entity, len(name_to_id))
+            for neighbor in neighbors:
+                name_to_id.setdefault(neighbor, len(name_to_id))
+        
+        n = len(name_to_id)
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        for entity, neighbors in self.graph.items():
+            indptr[name_to_id[entity] + 1] = len(neighbors)
+        np.cumsum(indptr, out=indptr)
+        
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        for entity, neighbors in self.graph.items():
+            start = indptr[name_to_id[entity]]
+            indices[start:start + len(neighbors)] = [
+                name_to_id[nb] for nb in neighbors
+            ]
+        
+        self._csr = (list(name_to_id), name_to_id, indptr, indices)
     
     def query(self, query_text, hops=1):
         """Search by hopping edges from query entities."""
         query_entities = self.extract_entities_simple(query_text)
-        results = set()
         
-        def hop(entity, depth):
-            results.add(entity)
-            if depth > 0 and entity in self.graph:
-                for neighbor in self.graph[entity]:
-                    hop(neighbor, depth - 1)
-        
-        for entity in query_entities:
-            if entity in self.graph:
-                hop(entity, hops)
+        if np is not None:
+            results = self._hop_csr(query_entities, hops)
+        else:
+            results = self._hop_dict(query_entities, hops)
         
         return {
             'query': query_text,
@@ -65,17 +144,63 @@ class SimpleLightRAG:
             'entity_count': len(results)
         }
     
+    def _hop_csr(self, query_entities, hops):
+        """Expand `hops` levels out over the CSR arrays."""
+        if self._csr is None:
+            self.finalize()
+        names, name_to_id, indptr, indices = self._csr
+        
+        frontier = np.unique(np.array(
+            [name_to_id[e] for e in query_entities if e in self.graph],
+            dtype=np.int32,
+        ))
+        if _bfs is not None:
+            return {names[i] for i in _bfs(indptr, indices, frontier, hops)}
+        
+        visited = frontier
+        for _ in range(hops):
+            if not frontier.size:
+                break
+            neighbors = np.concatenate(
+                [indices[indptr[v]:indptr[v + 1]] for v in frontier]
+            )
+            frontier = np.setdiff1d(neighbors, visited)
+            visited = np.union1d(visited, frontier)
+        
+        return {names[i] for i in visited}
+    
+    def _hop_dict(self, query_entities, hops):
+        """Breadth-first over the dict graph (no NumPy available)."""
+        # Each entity is expanded once
+        queue = deque((e, 0) for e in query_entities if e in self.graph)
+        results = set()
+        while queue:
+            entity, depth = queue.popleft()
+            if entity in results:
+                continue
+            results.add(entity)
+            if depth < hops:
+                queue.extend(
+                    (n, depth + 1) for n in self.graph.get(entity, ())
+                    if n not in results
+                )
+        return results
+    
     def export_graph(self, output_file="lightrag_graph.json"):
         """Export as JSON for NetworkX or Neo4j import."""
         export_data = {
             'entities': list(self.entities),
             'relationships': [
                 {'source': r[0], 'relation': r[1], 'target': r[2]}
-                for r in self.relationships
+                for r in sorted(self.relationships)
             ]
         }
-        with open(output_file, 'w') as f:
-            json.dump(export_data, f, indent=2)
+        if orjson is not None:
+            Path(output_file).write_bytes(
+                orjson.dumps(export_data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_file, 'w') as f:
+                json.dump(export_data, f, indent=2)
         print(f"Exported graph to {output_file}")
 
 